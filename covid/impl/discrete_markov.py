@@ -1,21 +1,25 @@
 """Functions for chain binomial simulation."""
 import tensorflow as tf
 import tensorflow_probability as tfp
+from tensorflow_probability.python.internal import samplers
 
 from covid.impl.util import compute_state, make_transition_matrix, transition_coords
 
 tfd = tfp.distributions
 
 
+@tf.function(autograph=False, experimental_compile=True)
 def approx_expm(rates):
     """Approximates a full Markov transition matrix
     :param rates: un-normalised rate matrix (i.e. diagonal zero)
     :returns: approximation to Markov transition matrix
     """
     total_rates = tf.reduce_sum(rates, axis=-1, keepdims=True)
-    prob = 1.0 - tf.math.exp(-tf.reduce_sum(rates, axis=-1, keepdims=True))
+    prob = 1.0 - tf.math.exp(-total_rates)
     mt1 = tf.math.multiply_no_nan(rates / total_rates, prob)
-    return tf.linalg.set_diag(mt1, 1.0 - tf.reduce_sum(mt1, axis=-1))
+    # Off-diagonal row sums of mt1 equal `prob` by construction, so the
+    # diagonal can be filled without a further reduction over mt1.
+    return tf.linalg.set_diag(mt1, 1.0 - prob[..., 0])
 
 
 def chain_binomial_propagate(h, time_step, stoichiometry, seed=None):
@@ -29,7 +33,7 @@ def chain_binomial_propagate(h, time_step, stoichiometry, seed=None):
     :returns : a function that propagate `state[t]` -> `state[t+time_step]`
     """
 
-    def propagate_fn(t, state):
+    def propagate_fn(t, state, seed=seed):
         rates = h(t, state)
         rate_matrix = make_transition_matrix(
             rates, transition_coords(stoichiometry), state.shape
@@ -37,27 +41,28 @@ def chain_binomial_propagate(h, time_step, stoichiometry, seed=None):
         # Set diagonal to be the negative of the sum of other elements in each row
         markov_transition = approx_expm(rate_matrix * time_step)
         num_states = markov_transition.shape[-1]
+        # Conditional Binomial decomposition of the row Multinomial,
+        # equivalent in law.  tfd.Binomial's batched BTRS rejection
+        # sampler draws each count in O(1) memory regardless of
+        # population size, and the explicit decomposition gives each
+        # draw its own stateless seed and keeps the whole construction
+        # XLA-compilable.  num_states is a compile-time constant, so
+        # the loop unrolls and a single tf.stack assembles the counts.
+        seeds = samplers.split_seed(seed, n=num_states - 1, salt="propagate_fn")
         prev_probs = tf.zeros_like(markov_transition[..., :, 0])
-        counts = tf.zeros(
-            markov_transition.shape[:-1].as_list() + [0], dtype=markov_transition.dtype
-        )
         total_count = state
-        # This for loop is ok because there are (currently) only 4 states (SEIR)
-        # and we're only actually creating work for 3 of them. Even for as many
-        # as a ~10 states it should probably be fine, just increasing the size
-        # of the graph a bit.
+        counts = []
         for i in range(num_states - 1):
             probs = markov_transition[..., :, i]
-            binom = tfd.Binomial(
+            sample = tfd.Binomial(
                 total_count=total_count,
                 probs=tf.clip_by_value(probs / (1.0 - prev_probs), 0.0, 1.0),
-            )
-            sample = binom.sample(seed=seed)
-            counts = tf.concat([counts, sample[..., tf.newaxis]], axis=-1)
+            ).sample(seed=seeds[i])
+            counts.append(sample)
             total_count -= sample
             prev_probs += probs
 
-        counts = tf.concat([counts, total_count[..., tf.newaxis]], axis=-1)
+        counts = tf.stack(counts + [total_count], axis=-1)
         new_state = tf.reduce_sum(counts, axis=-2)
         return counts, new_state
 
@@ -69,21 +74,55 @@ def discrete_markov_simulation(
 ):
     """Simulates from a discrete time Markov state transition model using multinomial sampling
     across rows of the """
-    propagate = chain_binomial_propagate(hazard_fn, time_step, stoichiometry, seed=seed)
+    propagate = chain_binomial_propagate(hazard_fn, time_step, stoichiometry)
     times = tf.range(start, end, time_step, dtype=state.dtype)
     state = tf.convert_to_tensor(state)
 
-    output = tf.TensorArray(state.dtype, size=times.shape[0])
+    # Sanitize to a stateless `[2]` seed tensor so the sampling ops are
+    # deterministic and XLA-compilable; the seed is split each iteration
+    # and threaded through the loop as a loop variable.
+    if callable(seed):  # e.g. a tfp.util.SeedStream
+        seed = seed()
+    seed = samplers.sanitize_seed(seed, salt="discrete_markov_simulation")
+
+    num_times = times.shape[0]  # None if start/end are not trace-time constants
+
+    # XLA-compile the time loop so that the per-timestep Binomial draws,
+    # transition matrix construction, and reductions fuse into a single
+    # kernel rather than paying per-op dispatch cost every timestep.
+    @tf.function(autograph=False, experimental_compile=True)
+    def simulate(state, seed):
+        # If the number of timesteps is known at trace time (the usual
+        # case -- epidemics run for a few hundred days), unroll the loop
+        # statically so XLA sees one flat graph and can fuse across
+        # timesteps rather than compiling a loop construct.
+        if num_times is not None and num_times <= 512:
+            seeds = samplers.split_seed(
+                seed, n=num_times, salt="discrete_markov_simulation"
+            )
+            updates = []
+            for i in range(num_times):
+                update, state = propagate(times[i], state, seed=seeds[i])
+                updates.append(update)
+            return state, tf.stack(updates, axis=0)
+
+        output = tf.TensorArray(state.dtype, size=times.shape[0])
 
-    cond = lambda i, *_: i < times.shape[0]
+        cond = lambda i, *_: i < times.shape[0]
 
-    def body(i, state, output):
-        update, state = propagate(times[i], state)
-        output = output.write(i, update)
-        return i + 1, state, output
+        def body(i, state, output, seed):
+            sample_seed, next_seed = samplers.split_seed(seed)
+            update, state = propagate(times[i], state, seed=sample_seed)
+            output = output.write(i, update)
+            return i + 1, state, output, next_seed
 
-    _, state, output = tf.while_loop(cond, body, loop_vars=(0, state, output))
-    return times, output.stack()
+        _, state, output, _ = tf.while_loop(
+            cond, body, loop_vars=(0, state, output, seed)
+        )
+        return state, output.stack()
+
+    _, output = simulate(state, seed)
+    return times, output
 
 
 def discrete_markov_log_prob(
@@ -118,21 +157,27 @@ def discrete_markov_log_prob(
     rate_matrix = make_transition_matrix(rates, tx_coords, tms_timeseries.shape)
     probs = approx_expm(rate_matrix * time_delta)
 
-    # [T, M, S, S] to [M, T, S, S]
-    probs = tf.transpose(probs, perm=(1, 0, 2, 3))
+    # `probs` is laid out [T, M, S, S], so build the event matrix in the
+    # same time-major layout rather than transposing the full 4-D probs
+    # tensor.  Only the much smaller [M, T, X] events tensor is permuted.
+    tms_events = tf.transpose(events, perm=(1, 0, 2))
     event_matrix = make_transition_matrix(
-        events, tx_coords, [num_meta, num_times, num_states]
+        tms_events, tx_coords, [num_times, num_meta, num_states]
     )
     event_matrix = tf.linalg.set_diag(
-        event_matrix, state_timeseries - tf.reduce_sum(event_matrix, axis=-1)
+        event_matrix, tms_timeseries - tf.reduce_sum(event_matrix, axis=-1)
+    )
+    # Rows of `event_matrix` sum to `tms_timeseries` by construction, so
+    # the Multinomial log density reduces to elementwise log-gamma and
+    # xlogy ops which fuse under XLA, avoiding the distribution-object
+    # overhead (and its intermediate float32 casts).
+    logp = (
+        tf.math.lgamma(tms_timeseries + 1.0)
+        - tf.reduce_sum(tf.math.lgamma(event_matrix + 1.0), axis=-1)
+        + tf.reduce_sum(tf.math.xlogy(event_matrix, probs), axis=-1)
     )
-    logp = tfd.Multinomial(
-        tf.cast(state_timeseries, dtype=tf.float32),
-        probs=tf.cast(probs, dtype=tf.float32),
-        name="log_prob",
-    ).log_prob(tf.cast(event_matrix, dtype=tf.float32))
 
-    return tf.cast(tf.reduce_sum(logp), dtype=events.dtype)
+    return tf.reduce_sum(logp)
 
 
 def events_to_full_transitions(events, initial_state):
@@ -143,9 +188,11 @@ def events_to_full_transitions(events, initial_state):
     :param initial_state: the initial state matrix of shape [c, s]
     """
 
-    def f(state, events):
-        survived = tf.reduce_sum(state, axis=-2) - tf.reduce_sum(events, axis=-1)
-        new_state = tf.linalg.set_diag(events, survived)
-        return new_state
-
-    return tf.scan(fn=f, elems=events, initializer=tf.linalg.diag(initial_state))
+    # The scan recurrence only carried forward per-state totals, which
+    # obey a conservation law: totals_{t+1} = totals_t + inflow_t -
+    # outflow_t.  Solving that in closed form replaces the sequential
+    # scan with a single vectorized cumulative sum over time.
+    inflow = tf.reduce_sum(events, axis=-2) - tf.linalg.diag_part(events)
+    outflow = tf.reduce_sum(events, axis=-1)
+    totals = initial_state + tf.cumsum(inflow - outflow, axis=0, exclusive=True)
+    return tf.linalg.set_diag(events, totals - outflow)
@@ -30,7 +30,7 @@ def _move_events(event_tensor, event_id, m, from_t, to_t, n_move):
     and adds n_move to event_tensor[m, to_t, event_id].
 
     :param event_tensor: shape [M, T, X]
-    :param event_id: the event id to move
+    :param event_id: a [M] tensor of the event id to move
     :param m: the metapopulation to move
     :param from_t: the move-from time
     :param to_t: the move-to time
@@ -38,13 +38,11 @@ def _move_events(event_tensor, event_id, m, from_t, to_t, n_move):
     :return: the modified event_tensor
     """
     # Todo rationalise this -- compute a delta, and add once.
-    indices = tf.stack(
-        [m, from_t, tf.broadcast_to(event_id, m.shape)], axis=-1  # All meta-populations
-    )  # Event
+    indices = tf.stack([m, from_t, event_id], axis=-1)  # All meta-populations
     # Subtract x_star from the [from_t, :, event_id] row of the state tensor
     n_move = tf.cast(n_move, event_tensor.dtype)
     new_state = tf.tensor_scatter_nd_sub(event_tensor, indices, n_move)
-    indices = tf.stack([m, to_t, tf.broadcast_to(event_id, m.shape)], axis=-1)
+    indices = tf.stack([m, to_t, event_id], axis=-1)
     # Add x_star to the [to_t, :, event_id] row of the state tensor
     new_state = tf.tensor_scatter_nd_add(new_state, indices, n_move)
     return new_state
@@ -100,6 +98,12 @@ class UncalibratedEventTimesUpdate(tfp.mcmc.TransitionKernel):
             prev_event_id, target_event_id, next_event_id
         )
         self.time_offsets = tf.range(self.parameters["dmax"])
+        # The scatter index column for the target event never changes, so
+        # build it once here rather than broadcasting it on every step.
+        self._target_event_col = tf.fill([mmax], target_event_id)
+        # Fixed-dtype constants used every step -- create them once.
+        self._neg_inf = tf.constant(-np.inf, dtype=DTYPE)
+        self._zero = tf.constant(0.0, dtype=DTYPE)
 
     @property
     def target_log_prob_fn(self):
@@ -169,7 +173,7 @@ class UncalibratedEventTimesUpdate(tfp.mcmc.TransitionKernel):
                     # Propagate state
                     next_state = _move_events(
                         event_tensor=current_events,
-                        event_id=self.tx_topology.target,
+                        event_id=self._target_event_col,
                         m=update["m"],
                         from_t=move["t"],
                         to_t=to_t,
@@ -202,17 +206,7 @@ class UncalibratedEventTimesUpdate(tfp.mcmc.TransitionKernel):
 
             def false_fn():
                 with tf.name_scope("false_fn"):
-                    next_target_log_prob = tf.constant(
-                        -np.inf, dtype=current_events.dtype
-                    )
-                    log_acceptance_correction = tf.constant(
-                        0.0, dtype=current_events.dtype
-                    )
-                    return (
-                        next_target_log_prob,
-                        log_acceptance_correction,
-                        current_events,
-                    )
+                    return (self._neg_inf, self._zero, current_events)
 
             # Trap out-of-bounds moves that go outside [0, num_times)
             next_target_log_prob, log_acceptance_correction, next_state = tf.cond(
@@ -241,7 +235,7 @@ class UncalibratedEventTimesUpdate(tfp.mcmc.TransitionKernel):
             init_state = tf.convert_to_tensor(init_state, dtype=DTYPE)
             init_target_log_prob = self.target_log_prob_fn(init_state)
             return EventTimesKernelResults(
-                log_acceptance_correction=tf.constant(0.0, dtype=DTYPE),
+                log_acceptance_correction=self._zero,
                 target_log_prob=init_target_log_prob,
                 extra=tf.zeros(init_state.shape[-3], dtype=DTYPE),
             )
@@ -46,32 +46,26 @@ def _abscumdiff(
         prev_events = _events_or_inf(events, topology.prev)
         target_events = tf.gather(events, topology.target, axis=-1)
         next_events = _events_or_inf(events, topology.next)
-        event_tensor = tf.stack([prev_events, target_events, next_events], axis=-1)
 
-        # Compute the absolute cumulative difference between event times
-        diff = event_tensor[..., 1:] - event_tensor[..., :-1]  # [m, T, 2]
-        cumdiff = tf.abs(tf.cumsum(diff, axis=-2))  # cumsum along time axis
-
-        # Create indices into cumdiff [m, d_max, 2].  Last dimension selects
-        # the bound for either the previous or next event.
-        indices = tf.stack(
-            [
-                tf.repeat(
-                    tf.range(events.shape[0], dtype=int_dtype), [bound_times.shape[1]]
-                ),
-                tf.reshape(bound_times, [-1]),
-                tf.repeat(tf.where(delta_t < 0, 0, 1), [bound_times.shape[1]]),
-            ],
-            axis=-1,
-        )
-        indices = tf.reshape(indices, [events.shape[-3], bound_times.shape[1], 3])
-        free_events = tf.gather_nd(cumdiff, indices)
-
-        # Add on initial state
+        # The bound for a move is set by the previous event if delta_t < 0
+        # and the next event otherwise.  Selecting the relevant difference
+        # series per metapopulation first means the cumulative sum runs
+        # over a single [m, T] tensor rather than both candidate bounds.
+        diff = tf.where(
+            delta_t < 0,
+            target_events - prev_events,
+            next_events - target_events,
+        )  # [m, T]
+        cumdiff = tf.abs(tf.cumsum(diff, axis=-1))  # cumsum along time axis
+        free_events = tf.gather(cumdiff, bound_times, batch_dims=1)
+
+        # Add on initial state.  The bounding column is `target` for
+        # left moves and `target + 1` for right moves -- plain integer
+        # arithmetic on the move direction avoids a tf.where select.
         indices = tf.stack(
             [
                 tf.range(events.shape[0]),
-                tf.where(delta_t[:, 0] < 0, topology.target, topology.target + 1),
+                topology.target + tf.cast(delta_t[:, 0] >= 0, delta_t.dtype),
             ],
             axis=-1,
         )
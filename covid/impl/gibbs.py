@@ -34,8 +34,10 @@ def get_tlp(results):
 
 
 def put_tlp(results, target_log_prob):
-    """Puts a target log prob into a results structure"""
+    """Puts a target log prob into a results structure, returning a
+    new structure rather than mutating the argument."""
     if isinstance(results, list):
+        results = list(results)
         results[0] = put_tlp(results[0], target_log_prob)
         return results
     else:
@@ -100,8 +102,9 @@ class GibbsStep(mcmc.TransitionKernel):
         """
 
         def fn(state_part):
-            state[self.state_elem] = state_part
-            return self.target_log_prob_fn(*state)
+            state_ = list(state)  # don't mutate the closed-over list
+            state_[self.state_elem] = state_part
+            return self.target_log_prob_fn(*state_)
 
         return fn
 
@@ -115,8 +118,9 @@ class GibbsStep(mcmc.TransitionKernel):
         next_state_part, next_results = self.inner_kernel.one_step(
             current_state[self.state_elem], previous_results, seed
         )
-        current_state[self.state_elem] = next_state_part
-        return current_state, next_results
+        next_state = list(current_state)
+        next_state[self.state_elem] = next_state_part
+        return next_state, next_results
 
     def bootstrap_results(self, current_state):
         put_tlp_fn(self.inner_kernel, self.conditional_target_log_prob(current_state))
@@ -143,11 +147,13 @@ class DeterministicScanKernel(mcmc.TransitionKernel):
       such that each kernel has a current `target_log_prob` value.  In graph 
       and XLA modes, the for loop should be unrolled.
       """
-        next_results = previous_results  # Semantic sugar
+        next_results = list(previous_results)  # don't mutate the caller's list
         next_state = current_state
         for i, sampler in enumerate(self.kernel_list):
+            # Read from next_results so each kernel sees the tlp
+            # forwarded to it by its predecessor in this scan.
             next_state, next_results[i] = sampler.one_step(
-                next_state, previous_results[i], seed
+                next_state, next_results[i], seed
             )
             tlp = get_tlp(next_results[i])
             next_idx = (i + 1) % len(self.kernel_list)
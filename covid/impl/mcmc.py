@@ -17,34 +17,64 @@ DTYPE = covid.config.floatX
 tfd = tfp.distributions
 
 
-def random_walk_mvnorm_fn(covariance, p_u=0.95, name=None):
+def random_walk_mvnorm_fn(covariance=None, p_u=0.95, scale_tril=None, name=None):
     """Returns callable that adds Multivariate Normal noise to the input
-    :param covariance: the covariance matrix of the mvnorm proposal
+    :param covariance: the covariance matrix of the mvnorm proposal.  May be
+                       a `tf.Variable`, in which case the Cholesky factor is
+                       computed inside the proposal so that in-place
+                       `assign`s (e.g. during adaptation) take effect
+                       without retracing an enclosing `tf.function`.
+                       Ignored if `scale_tril` is supplied.
     :param p_u: the bounded convergence parameter.  If equal to 1, then all proposals are drawn from the
                 MVN(0, covariance) distribution, if less than 1, proposals are drawn from MVN(0, covariance)
                 with probabilit p_u, and MVN(0, 0.1^2I_d/d) otherwise.
+    :param scale_tril: an optional precomputed lower triangular Cholesky
+                       factor of the (jittered) covariance.  Supplying this
+                       skips the O(d^3) factorization here, e.g. where the
+                       caller maintains the factor incrementally during
+                       adaptation.
     :returns: a function implementing the proposal.
     """
-    covariance = covariance + tf.eye(covariance.shape[0], dtype=DTYPE) * 1.0e-9
-    scale_tril = tf.linalg.cholesky(covariance)
-    rv_adapt = tfp.distributions.MultivariateNormalTriL(
-        loc=tf.zeros(covariance.shape[0], dtype=DTYPE), scale_tril=scale_tril
-    )
-    rv_fix = tfp.distributions.Normal(
-        loc=tf.zeros(covariance.shape[0], dtype=DTYPE),
-        scale=0.01 / covariance.shape[0],
-    )
+    if scale_tril is None:
+        dim = covariance.shape[0]
+        jitter = tf.eye(dim, dtype=DTYPE) * 1.0e-9
+        if isinstance(covariance, tf.Variable):
+            scale_tril = lambda: tf.linalg.cholesky(
+                tf.convert_to_tensor(covariance) + jitter
+            )
+        else:
+            scale_tril = tf.linalg.cholesky(covariance + jitter)
+    else:
+        dim = scale_tril.shape[0]
+    fix_scale = tf.constant(0.01, dtype=DTYPE) / dim
     u = tfp.distributions.Bernoulli(probs=p_u)
 
     def _fn(state_parts, seed):
         with tf.name_scope(name or "random_walk_mvnorm_fn"):
+            scale = scale_tril() if callable(scale_tril) else scale_tril
+            part_seeds = samplers.split_seed(
+                seed, n=len(state_parts), salt="random_walk_mvnorm_fn"
+            )
 
-            def proposal():
-                rv = tf.stack([rv_fix.sample(), rv_adapt.sample()])
-                uv = u.sample(seed=seed)
-                return tf.gather(rv, uv)
+            def proposal(seed):
+                # A single stateless standard Normal draw feeds both
+                # mixture components -- applying `scale_tril` explicitly
+                # leaves XLA a plain triangular matvec to fuse, instead
+                # of a MultivariateNormalTriL sample.
+                z_seed, u_seed = samplers.split_seed(seed)
+                # Proposal noise does not need double precision: draw in
+                # float32 for throughput and cast up, keeping the scale
+                # application and accept/reject arithmetic in floatX.
+                z = tf.cast(
+                    samplers.normal([dim], seed=z_seed, dtype=tf.float32), DTYPE
+                )
+                uv = u.sample(seed=u_seed)
+                return tf.where(uv > 0, tf.linalg.matvec(scale, z), fix_scale * z)
 
-            new_state_parts = [proposal() + state_part for state_part in state_parts]
+            new_state_parts = [
+                proposal(part_seed) + state_part
+                for part_seed, state_part in zip(part_seeds, state_parts)
+            ]
             return new_state_parts
 
     return _fn
@@ -173,19 +203,31 @@ class MH_within_Gibbs(tfp.mcmc.TransitionKernel):
         """
         self._target_log_prob_fn = target_log_prob_fn
         self._make_kernel_fns = make_kernel_fns
+        self._current_state = None
 
-    def is_calibrated(self):
-        return True
-
-    def one_step(self, state, step_results):
-        prev_step = np.roll(np.arange(len(self._make_kernel_fns)), 1)
-        for i, make_kernel_fn in enumerate(self._make_kernel_fns):
+        # Construct the kernels once here rather than on every call to
+        # `one_step` -- rebuilding them created fresh closures each step
+        # and re-traced each kernel's graph.  `i` is bound by value to
+        # avoid the closure late-binding bug.
+        self._kernels = []
+        for i, make_kernel_fn in enumerate(make_kernel_fns):
 
-            def _target_log_prob_fn_part(state_part):
+            def _target_log_prob_fn_part(state_part, i=i):
+                state = list(self._current_state)
                 state[i] = state_part
                 return self._target_log_prob_fn(*state)
 
-            kernel = make_kernel_fn(_target_log_prob_fn_part)
+            self._kernels.append(make_kernel_fn(_target_log_prob_fn_part))
+
+    def is_calibrated(self):
+        return True
+
+    def one_step(self, state, step_results):
+        prev_step = np.roll(np.arange(len(self._kernels)), 1)
+        state = list(state)
+        step_results = list(step_results)
+        self._current_state = state
+        for i, kernel in enumerate(self._kernels):
             results = advance_target_log_prob(
                 step_results[i], step_results[prev_step[i]]
             ) or kernel.bootstrap_results(state[i])
@@ -193,14 +235,8 @@ class MH_within_Gibbs(tfp.mcmc.TransitionKernel):
         return state, step_results
 
     def bootstrap_results(self, state):
-        results = []
-        for i, make_kernel_fn in enumerate(self._make_kernel_fns):
-
-            def _target_log_prob_fn_part(state_part):
-                state[i] = state_part
-                return self._target_log_prob_fn(*state)
-
-            kernel = make_kernel_fn(_target_log_prob_fn_part)
-            results.append(kernel.bootstrap_results(init_state=state[i]))
-
-        return results
+        self._current_state = list(state)
+        return [
+            kernel.bootstrap_results(init_state=state[i])
+            for i, kernel in enumerate(self._kernels)
+        ]
@@ -169,7 +169,9 @@ class UncalibratedOccultUpdate(tfp.mcmc.TransitionKernel):
 
                 return update, next_state, log_acceptance_correction
 
-            u = tfd.Uniform().sample()
+            # Scalar draw direct from the RNG -- no need to build a
+            # distribution object for a single uniform variate per step.
+            u = tf.random.uniform([], dtype=current_events.dtype)
             delta, next_state, log_acceptance_correction = tf.cond(
                 (u < 0.5)
                 & (
@@ -5,6 +5,7 @@ import pandas as pd
 import tensorflow as tf
 import tensorflow_probability as tfp
 from tensorflow_probability.python.internal import dtype_util
+from tensorflow_probability.python.internal import samplers
 
 tfd = tfp.distributions
 import h5py
@@ -221,24 +222,31 @@ def extract_liverpool(in_file: str, out_file: str):
 
 
 @tf.function
-def generate_case_numbers(n, rate):
+def generate_case_numbers(n, rate, seed=None):
 
     dtype = dtype_util.common_dtype([n, rate], dtype_hint=tf.float64)
     n = tf.convert_to_tensor(n, dtype=dtype)
     rate = tf.convert_to_tensor(rate, dtype=dtype)
+    prob = tf.constant(1.0, dtype=dtype) - tf.math.exp(-rate)
+    seed = samplers.sanitize_seed(seed, salt="generate_case_numbers")
 
-    def cond(n_, i_, accum_):
+    def cond(n_, i_, accum_, seed_):
         return tf.greater(tf.reduce_sum(n_), tf.constant(0.0, dtype=dtype))
 
-    def body(n_, i_, accum_):
-        new_n = tfd.Binomial(
-            n_, probs=tf.constant(1.0, dtype=dtype) - tf.math.exp(-rate)
-        ).sample()
+    def body(n_, i_, accum_, seed_):
+        sample_seed, next_seed = samplers.split_seed(seed_)
+        new_n = tf.random.stateless_binomial(
+            shape=tf.shape(n_),
+            seed=sample_seed,
+            counts=n_,
+            probs=prob,
+            output_dtype=dtype,
+        )
         accum_ = accum_.write(i_, new_n)
-        return n_ - new_n, i_ + 1, accum_
+        return n_ - new_n, i_ + 1, accum_, next_seed
 
     accum = tf.TensorArray(dtype=n.dtype, size=20, dynamic_size=True)
-    n, i, accum = tf.while_loop(cond, body, (n, 0, accum))
+    n, i, accum, _ = tf.while_loop(cond, body, (n, 0, accum, seed))
     return accum.gather(tf.range(i))
 
 
@@ -274,6 +282,44 @@ def initialise_previous_events(events, rate):
     return events
 
 
+class RunningCovariance:
+    """Accumulates a sample covariance matrix incrementally.
+
+    Blocks of draws are folded in with Chan et al.'s parallel update
+    formula, so the cost per block is O(block_size * dim^2) regardless
+    of how many draws have been accumulated so far.
+    """
+
+    def __init__(self, dim):
+        self.n = 0
+        self.mean = np.zeros(dim, dtype=np.float64)
+        self.m2 = np.zeros((dim, dim), dtype=np.float64)
+
+    def update(self, block):
+        """Folds a block of draws into the estimate.
+
+        :param block: a `[num_samples, dim]` array of draws
+        """
+        block = np.asarray(block, dtype=np.float64)
+        n_new = block.shape[0]
+        if n_new == 0:
+            return
+        new_mean = block.mean(axis=0)
+        centred = block - new_mean
+        delta = new_mean - self.mean
+        n_total = self.n + n_new
+        self.mean = self.mean + delta * n_new / n_total
+        self.m2 = self.m2 + centred.T @ centred + np.outer(
+            delta, delta
+        ) * self.n * n_new / n_total
+        self.n = n_total
+
+    @property
+    def cov(self):
+        """The sample covariance of all draws folded in so far."""
+        return self.m2 / (self.n - 1)
+
+
 def squared_jumping_distance(chain):
     diff = chain[1:] - chain[:-1]
     cumdiff = np.cumsum(diff, axis=-1)
@@ -368,28 +414,35 @@ def plot_event_posterior(posterior, simulation, metapopulation=0):
     return fig, ax
 
 
-def distribute_geom(events, rate, delta_t=1.0):
+def distribute_geom(events, rate, delta_t=1.0, seed=None):
     """Given a tensor `events`, returns a tensor of shape `events.shape + [t]`
     representing the events distributed over a number of days given geometric
     waiting times with rate `1-exp(-rate*delta_t)`"""
 
     events = tf.convert_to_tensor(events)
     rate = tf.convert_to_tensor(rate, dtype=events.dtype)
+    seed = samplers.sanitize_seed(seed, salt="distribute_geom")
 
     accum = tf.TensorArray(events.dtype, size=0, dynamic_size=True)
     prob = 1.0 - tf.exp(-rate * delta_t)
 
-    def body(i, events_, accum_):
-        rv = tfd.Binomial(total_count=events_, probs=prob)
-        failures = rv.sample()
+    def body(i, events_, accum_, seed_):
+        sample_seed, next_seed = samplers.split_seed(seed_)
+        failures = tf.random.stateless_binomial(
+            shape=tf.shape(events_),
+            seed=sample_seed,
+            counts=events_,
+            probs=prob,
+            output_dtype=events.dtype,
+        )
         accum_ = accum_.write(i, failures)
         i += 1
-        return i, events_ - failures, accum_
+        return i, events_ - failures, accum_, next_seed
 
-    def cond(_1, events_, _2):
+    def cond(_1, events_, _2, _3):
         return tf.reduce_sum(events_) > tf.constant(0, dtype=events.dtype)
 
-    _1, _2, accum = tf.while_loop(cond, body, loop_vars=[1, events, accum])
+    _1, _2, accum, _3 = tf.while_loop(cond, body, loop_vars=[1, events, accum, seed])
 
     return tf.transpose(accum.stack(), perm=(1, 0, 2))
 
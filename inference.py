@@ -1,6 +1,7 @@
 """MCMC Test Rig for COVID-19 UK model"""
 import argparse
 import os
+from concurrent.futures import ThreadPoolExecutor
 from time import perf_counter
 
 import tqdm
@@ -10,7 +11,20 @@ import numpy as np
 import tensorflow as tf
 import tensorflow_probability as tfp
 
+try:
+    # Blosc/LZ4 compresses the event tensors many times faster than the
+    # single-threaded gzip/szip codecs for similar ratios.
+    import hdf5plugin
+
+    EVENT_COMPRESSION = hdf5plugin.Blosc(
+        cname="lz4", clevel=3, shuffle=hdf5plugin.Blosc.SHUFFLE
+    )
+except ImportError:
+    # Uncompressed chunked storage still beats szip on the write path.
+    EVENT_COMPRESSION = {}
+
 from covid import config
+from covid.util import RunningCovariance
 from covid.impl.util import compute_state
 from covid.impl.mcmc import UncalibratedLogRandomWalk, random_walk_mvnorm_fn
 from covid.impl.event_time_mh import UncalibratedEventTimesUpdate
@@ -44,7 +58,7 @@ if __name__ == "__main__":
     print("Loading config file:", args.config)
 
     with open(args.config, "r") as f:
-        config = yaml.load(f, Loader=yaml.FullLoader)
+        config = yaml.load(f, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
 
     covar_data = model_spec.read_covariates(config["data"])
 
@@ -86,8 +100,13 @@ if __name__ == "__main__":
     # Full joint log posterior distribution
     # $\pi(\theta, \xi, y^{se}, y^{ei} | y^{ir})$
     def logp(theta, xi, events):
+        # Unstacking the fixed-length parameter vector gives XLA plain
+        # scalars to constant-fold into the prior evaluations, rather
+        # than three per-element gathers.
+        theta = tf.ensure_shape(theta, [3])
+        beta1, beta2, gamma = tf.unstack(theta)
         return model.log_prob(
-            dict(beta1=theta[0], beta2=theta[1], gamma=theta[2], xi=xi, seir=events,)
+            dict(beta1=beta1, beta2=beta2, gamma=gamma, xi=xi, seir=events,)
         )
 
     # Build Metropolis within Gibbs sampler
@@ -174,8 +193,10 @@ if __name__ == "__main__":
             q_ratio = result.proposed_results.log_acceptance_correction
             if hasattr(result.proposed_results, "extra"):
                 proposed = tf.cast(result.proposed_results.extra, log_prob.dtype)
-                return tf.concat([[log_prob], [accepted], [q_ratio], proposed], axis=0)
-            return tf.concat([[log_prob], [accepted], [q_ratio]], axis=0)
+                return tf.concat(
+                    [tf.stack([log_prob, accepted, q_ratio]), proposed], axis=0
+                )
+            return tf.stack([log_prob, accepted, q_ratio])
 
         def recurse(f, list_or_atom):
             if isinstance(list_or_atom, list):
@@ -184,34 +205,76 @@ if __name__ == "__main__":
 
         return recurse(f, results)
 
+    # Scaling matrices for the random walk proposals.  These are
+    # tf.Variables so that adaptation can update them in place:
+    # tf.function reads Variables by reference, so an assign() is seen
+    # by the compiled sample() graph without retracing it.
+    theta_scale = tf.constant(
+        [
+            [1.12e-3, 1.67e-4, 1.61e-4],
+            [1.67e-4, 7.41e-4, 4.68e-5],
+            [1.61e-4, 4.68e-5, 1.28e-4],
+        ],
+        dtype=DTYPE,
+    )
+    theta_scale = tf.Variable(
+        theta_scale * 0.2 / theta_scale.shape[0], trainable=False
+    )
+
+    xi_scale = tf.eye(model.model["xi"]().event_shape[-1], dtype=DTYPE)
+    xi_scale = tf.Variable(xi_scale * 0.0001 / xi_scale.shape[0], trainable=False)
+
+    # The kernel stack is built once and closed over by `sample` so that
+    # each burst reuses the same kernels (and hence the same compiled
+    # graph) rather than reconstructing and re-tracing them per burst.
+    gibbs_kernel = DeterministicScanKernel(
+        [
+            make_theta_kernel(theta_scale, 1.0, "theta_kernel"),
+            make_xi_kernel(xi_scale, 1.0, "xi_kernel"),
+            MultiScanKernel(
+                config["mcmc"]["num_event_time_updates"],
+                DeterministicScanKernel(
+                    [
+                        make_partially_observed_step(0, None, 1, "se_events"),
+                        make_partially_observed_step(1, 0, 2, "ei_events"),
+                        make_occults_step(None, 0, 1, "se_occults"),
+                        make_occults_step(0, 1, 2, "ei_occults"),
+                    ]
+                ),
+            ),
+        ],
+        name="gibbs_kernel",
+    )
+
     # Build MCMC algorithm here.  This will be run in bursts for memory economy
-    @tf.function(autograph=False, experimental_compile=True)
-    def sample(n_samples, init_state, sigma_theta, sigma_xi):
+    # The input signature is pinned so that every burst hits the same
+    # XLA-compiled concrete function: without it, passing numpy arrays
+    # on the first burst and tensors thereafter would retrace.
+    @tf.function(
+        input_signature=[
+            tf.TensorSpec([], dtype=tf.int32),
+            [
+                tf.TensorSpec([3], dtype=DTYPE),
+                tf.TensorSpec([model.model["xi"]().event_shape[-1]], dtype=DTYPE),
+                tf.TensorSpec(events.shape, dtype=DTYPE),
+            ],
+        ],
+        autograph=False,
+        experimental_compile=True,
+    )
+    def sample(n_samples, init_state):
         with tf.name_scope("main_mcmc_sample_loop"):
 
             init_state = init_state.copy()
 
-            kernel = DeterministicScanKernel(
-                [
-                    make_theta_kernel(sigma_theta, 1.0, "theta_kernel"),
-                    make_xi_kernel(sigma_xi, 1.0, "xi_kernel"),
-                    MultiScanKernel(
-                        config["mcmc"]["num_event_time_updates"],
-                        DeterministicScanKernel(
-                            [
-                                make_partially_observed_step(0, None, 1, "se_events"),
-                                make_partially_observed_step(1, 0, 2, "ei_events"),
-                                make_occults_step(None, 0, 1, "se_occults"),
-                                make_occults_step(0, 1, 2, "ei_occults"),
-                            ]
-                        ),
-                    ),
-                ],
-                name="gibbs_kernel",
-            )
-
+            # Thinning is done inside sample_chain, so discarded draws
+            # are never materialized in the returned trace.
             samples, results = tfp.mcmc.sample_chain(
-                n_samples, init_state, kernel=kernel, trace_fn=trace_results_fn
+                n_samples,
+                init_state,
+                kernel=gibbs_kernel,
+                num_steps_between_results=config["mcmc"]["thin"] - 1,
+                trace_fn=trace_results_fn,
             )
 
             return samples, results
@@ -260,111 +323,104 @@ if __name__ == "__main__":
     xi_samples = posterior.create_dataset(
         "samples/xi", [NUM_SAVED_SAMPLES, current_state[1].shape[0]], dtype=np.float64,
     )
+    # Chunks are aligned to whole thinned bursts so each burst write
+    # touches a contiguous run of chunks.  Event counts are integers,
+    # so int32 storage halves the bytes pushed through the codec
+    # relative to float64.
     event_samples = posterior.create_dataset(
         "samples/events",
         event_size,
-        dtype=DTYPE,
-        chunks=(32, 32, 32, 1),
-        compression="szip",
-        compression_opts=("nn", 16),
+        dtype=np.int32,
+        chunks=(min(THIN_BURST_SAMPLES, 64), event_size[1], event_size[2], 1),
+        **EVENT_COMPRESSION,
     )
 
-    output_results = [
-        posterior.create_dataset("results/theta", (NUM_SAVED_SAMPLES, 3), dtype=DTYPE,),
-        posterior.create_dataset("results/xi", (NUM_SAVED_SAMPLES, 3), dtype=DTYPE,),
-        posterior.create_dataset(
-            "results/move/S->E", (NUM_SAVED_SAMPLES, 3 + num_metapop), dtype=DTYPE,
-        ),
-        posterior.create_dataset(
-            "results/move/E->I", (NUM_SAVED_SAMPLES, 3 + num_metapop), dtype=DTYPE,
-        ),
-        posterior.create_dataset(
-            "results/occult/S->E", (NUM_SAVED_SAMPLES, 6), dtype=DTYPE
-        ),
-        posterior.create_dataset(
-            "results/occult/E->I", (NUM_SAVED_SAMPLES, 6), dtype=DTYPE
-        ),
-    ]
+    # All per-kernel results go into one compound-dtype dataset so that
+    # each burst costs one h5py write rather than six, each with its own
+    # chunk lookup.
+    results_dtype = np.dtype(
+        [
+            ("theta", DTYPE, (3,)),
+            ("xi", DTYPE, (3,)),
+            ("move/S->E", DTYPE, (3 + num_metapop,)),
+            ("move/E->I", DTYPE, (3 + num_metapop,)),
+            ("occult/S->E", DTYPE, (6,)),
+            ("occult/E->I", DTYPE, (6,)),
+        ]
+    )
+    output_results = posterior.create_dataset(
+        "results", (NUM_SAVED_SAMPLES,), dtype=results_dtype
+    )
     posterior.swmr_mode = True
 
     print("Initial logpi:", logp(*current_state))
 
-    theta_scale = tf.constant(
-        [
-            [1.12e-3, 1.67e-4, 1.61e-4],
-            [1.67e-4, 7.41e-4, 4.68e-5],
-            [1.61e-4, 4.68e-5, 1.28e-4],
-        ],
-        dtype=DTYPE,
-    )
-    theta_scale = theta_scale * 0.2 / theta_scale.shape[0]
+    # HDF5 writes (and their compression) happen on a background thread
+    # so the next burst's computation is not serialized behind disk I/O.
+    # A single worker with one outstanding future keeps writes ordered
+    # and bounds memory to one burst of staged samples.
+    def write_burst(burst, theta, xi, events, burst_results):
+        s = slice(
+            burst * THIN_BURST_SAMPLES, burst * THIN_BURST_SAMPLES + THIN_BURST_SAMPLES
+        )
+        theta_samples[s, ...] = theta
+        xi_samples[s, ...] = xi
+        event_samples[s, ...] = events
+        output_results[s] = burst_results
+        posterior.flush()
+        # Acceptance diagnostics come from the staged numpy arrays so
+        # the main loop never blocks on a device sync to print them.
+        for name in results_dtype.names:
+            print(
+                f"Acceptance {name}:", np.mean(burst_results[name][:, 1]), flush=True
+            )
+
+    io_executor = ThreadPoolExecutor(max_workers=1)
+    write_future = None
 
-    xi_scale = tf.eye(current_state[1].shape[0], dtype=DTYPE)
-    xi_scale = xi_scale * 0.0001 / xi_scale.shape[0]
+    # The covariance of log(theta) is accumulated online, burst by
+    # burst, rather than recomputed over the whole sample history (and
+    # re-read from the HDF5 file) each burst.
+    theta_cov = RunningCovariance(current_state[0].shape[0])
 
     # We loop over successive calls to sample because we have to dump results
     #   to disc, or else end OOM (even on a 32GB system).
     # with tf.profiler.experimental.Profile("/tmp/tf_logdir"):
     for i in tqdm.tqdm(range(NUM_BURSTS), unit_scale=NUM_BURST_SAMPLES):
-        samples, results = sample(
-            NUM_BURST_SAMPLES,
-            init_state=current_state,
-            sigma_theta=theta_scale,
-            sigma_xi=xi_scale,
-        )
+        samples, results = sample(THIN_BURST_SAMPLES, init_state=current_state)
         current_state = [s[-1] for s in samples]
-        s = slice(i * THIN_BURST_SAMPLES, i * THIN_BURST_SAMPLES + THIN_BURST_SAMPLES)
-        idx = tf.constant(range(0, NUM_BURST_SAMPLES, config["mcmc"]["thin"]))
-        theta_samples[s, ...] = tf.gather(samples[0], idx)
-        xi_samples[s, ...] = tf.gather(samples[1], idx)
-        # cov = np.cov(
-        #     np.log(theta_samples[: (i * NUM_BURST_SAMPLES + NUM_BURST_SAMPLES), ...]),
-        #     rowvar=False,
-        # )
-        print(current_state[0].numpy(), flush=True)
-        # print(cov, flush=True)
-        # if (i * NUM_BURST_SAMPLES) > 1000 and np.all(np.isfinite(cov)):
-        #     theta_scale = 2.38 ** 2 * cov / 2.0
+        flat_results = flatten_results(results)
 
+        # Force the device->host copies here; the h5py writes themselves
+        # run on the I/O thread.
         start = perf_counter()
-        event_samples[s, ...] = tf.gather(samples[2], idx)
+        theta_np = samples[0].numpy()
+        xi_np = samples[1].numpy()
+        event_np = tf.cast(samples[2], tf.int32).numpy()
+        results_np = np.empty(THIN_BURST_SAMPLES, dtype=results_dtype)
+        for name, res in zip(results_dtype.names, flat_results):
+            results_np[name] = res.numpy()
         end = perf_counter()
 
-        flat_results = flatten_results(results)
-        for i, ro in enumerate(output_results):
-            ro[s, ...] = tf.gather(flat_results[i], idx)
-
-        posterior.flush()
-        print("Storage time:", end - start, "seconds")
-        print(
-            "Acceptance theta:",
-            tf.reduce_mean(tf.cast(flat_results[0][:, 1], tf.float32)),
-        )
-        print(
-            "Acceptance xi:", tf.reduce_mean(tf.cast(flat_results[1][:, 1], tf.float32))
-        )
-        print(
-            "Acceptance move S->E:",
-            tf.reduce_mean(tf.cast(flat_results[2][:, 1], tf.float32)),
-        )
-        print(
-            "Acceptance move E->I:",
-            tf.reduce_mean(tf.cast(flat_results[3][:, 1], tf.float32)),
-        )
-        print(
-            "Acceptance occult S->E:",
-            tf.reduce_mean(tf.cast(flat_results[4][:, 1], tf.float32)),
-        )
-        print(
-            "Acceptance occult E->I:",
-            tf.reduce_mean(tf.cast(flat_results[5][:, 1], tf.float32)),
+        if write_future is not None:
+            write_future.result()  # backpressure: one write in flight
+        write_future = io_executor.submit(
+            write_burst, i, theta_np, xi_np, event_np, results_np
         )
 
-    print(f"Acceptance theta: {output_results[0][:, 1].mean()}")
-    print(f"Acceptance xi: {output_results[1][:, 1].mean()}")
-    print(f"Acceptance move S->E: {output_results[2][:, 1].mean()}")
-    print(f"Acceptance move E->I: {output_results[3][:, 1].mean()}")
-    print(f"Acceptance occult S->E: {output_results[4][:, 1].mean()}")
-    print(f"Acceptance occult E->I: {output_results[5][:, 1].mean()}")
+        theta_cov.update(np.log(theta_np))
+        print(current_state[0].numpy(), flush=True)
+        # print(theta_cov.cov, flush=True)
+        # if (i * NUM_BURST_SAMPLES) > 1000 and np.all(np.isfinite(theta_cov.cov)):
+        #     theta_scale.assign(2.38 ** 2 * theta_cov.cov / 2.0)
+
+        print("Transfer time:", end - start, "seconds")
+
+    if write_future is not None:
+        write_future.result()
+    io_executor.shutdown()
+
+    for name in results_dtype.names:
+        print(f"Acceptance {name}: {output_results[name][:, 1].mean()}")
 
     posterior.close()
@@ -16,6 +16,19 @@ TIME_DELTA = 1.0
 XI_FREQ = 14  # baseline transmission changes every 14 days
 NU = tf.constant(0.5, dtype=DTYPE)  # E->I rate assumed known.
 
+# Priors with fixed hyperparameters are built once at module scope, so
+# repeated joint log-prob evaluations only pay for `log_prob` itself
+# rather than re-creating the distribution objects.
+BETA1_PRIOR = tfd.Gamma(
+    concentration=tf.constant(1.0, dtype=DTYPE), rate=tf.constant(1.0, dtype=DTYPE),
+)
+BETA2_PRIOR = tfd.Gamma(
+    concentration=tf.constant(3.0, dtype=DTYPE), rate=tf.constant(10.0, dtype=DTYPE),
+)
+GAMMA_PRIOR = tfd.Gamma(
+    concentration=tf.constant(100.0, dtype=DTYPE), rate=tf.constant(400.0, dtype=DTYPE),
+)
+
 
 def read_covariates(paths):
     """Loads covariate data
@@ -59,9 +72,17 @@ def impute_censored_events(cases):
     """
     ei_events, lag_ei = impute_previous_cases(cases, 0.44)
     se_events, lag_se = impute_previous_cases(ei_events, 2.0)
-    ir_events = np.pad(cases, ((0, 0), (lag_ei + lag_se - 2, 0)))
-    ei_events = np.pad(ei_events, ((0, 0), (lag_se - 1, 0)))
-    return tf.stack([se_events, ei_events, ir_events], axis=-1)
+
+    # Write each series into its lagged position in one preallocated
+    # array rather than padding and stacking three full-size
+    # intermediates.
+    lag_ei = int(lag_ei)
+    lag_se = int(lag_se)
+    events = np.zeros(tuple(se_events.shape) + (3,), dtype=DTYPE)
+    events[:, :, 0] = se_events
+    events[:, lag_se - 1 :, 1] = ei_events
+    events[:, lag_ei + lag_se - 2 :, 2] = cases
+    return tf.convert_to_tensor(events)
 
 
 def CovidUK(
@@ -71,29 +92,34 @@ def CovidUK(
     """
 
     def beta1():
-        return tfd.Gamma(
-            concentration=tf.constant(1.0, dtype=DTYPE),
-            rate=tf.constant(1.0, dtype=DTYPE),
-        )
+        return BETA1_PRIOR
 
     def beta2():
-        return tfd.Gamma(
-            concentration=tf.constant(3.0, dtype=DTYPE),
-            rate=tf.constant(10.0, dtype=DTYPE),
-        )
+        return BETA2_PRIOR
+
+    # The xi prior depends on `num_steps`, so it is cached per model
+    # instance rather than at module scope.  The GP index points are
+    # fixed, so the covariance is assembled and factorized once here;
+    # each log-prob evaluation then costs a triangular solve rather
+    # than a fresh O(n^3) Cholesky inside tfd.GaussianProcess.
+    sigma = tf.constant(0.01, dtype=DTYPE)
+    phi = tf.constant(24.0, dtype=DTYPE)
+    kernel = tfp.math.psd_kernels.MaternThreeHalves(sigma, phi)
+    idx_pts = tf.cast(tf.range(num_steps // XI_FREQ) * XI_FREQ, dtype=DTYPE)
+    kernel_matrix = kernel.matrix(idx_pts[:, tf.newaxis], idx_pts[:, tf.newaxis])
+    kernel_matrix = kernel_matrix + tf.eye(
+        idx_pts.shape[0], dtype=DTYPE
+    ) * tf.constant(1.0e-6, dtype=DTYPE)  # jitter as per tfd.GaussianProcess
+    xi_prior = tfd.MultivariateNormalTriL(
+        loc=tf.zeros([idx_pts.shape[0]], dtype=DTYPE),
+        scale_tril=tf.linalg.cholesky(kernel_matrix),
+    )
 
     def xi():
-        sigma = tf.constant(0.01, dtype=DTYPE)
-        phi = tf.constant(24.0, dtype=DTYPE)
-        kernel = tfp.math.psd_kernels.MaternThreeHalves(sigma, phi)
-        idx_pts = tf.cast(tf.range(num_steps // XI_FREQ) * XI_FREQ, dtype=DTYPE)
-        return tfd.GaussianProcess(kernel, index_points=idx_pts[:, tf.newaxis])
+        return xi_prior
 
     def gamma():
-        return tfd.Gamma(
-            concentration=tf.constant(100.0, dtype=DTYPE),
-            rate=tf.constant(400.0, dtype=DTYPE),
-        )
+        return GAMMA_PRIOR
 
     def seir(beta1, beta2, xi, gamma):
 
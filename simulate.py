@@ -28,7 +28,7 @@ options, cmd_args = parser.parse_args(["-c", "example_config.yaml"])
 print("Loading config file:", options.config)
 
 with open(options.config, "r") as f:
-    config = yaml.load(f, Loader=yaml.FullLoader)
+    config = yaml.load(f, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
 
 
 # Load in covariate data
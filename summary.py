@@ -106,7 +106,7 @@ if __name__ == "__main__":
 
     # Get general config
     with open(CONFIG_FILE, "r") as f:
-        config = yaml.load(f, Loader=yaml.FullLoader)
+        config = yaml.load(f, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
 
     # Load covariate data
     covar_data = model_spec.read_covariates(config["data"])
@@ -120,7 +120,9 @@ if __name__ == "__main__":
     idx = slice(posterior["samples/theta"].shape[0])  # range(6000, 10000, 10)
     theta = posterior["samples/theta"][idx]
     xi = posterior["samples/xi"][idx]
-    events = posterior["samples/events"][idx]
+    # Events are stored as int32; cast back up to the model dtype so
+    # compute_state and calc_R_it mix them with float64 tensors.
+    events = posterior["samples/events"][idx].astype(DTYPE)
     init_state = posterior["initial_state"][:]
     state_timeseries = compute_state(init_state, events, model_spec.STOICHIOMETRY)
 
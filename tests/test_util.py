@@ -5,11 +5,25 @@ import os
 import numpy as np
 
 
-from covid.util import regularize_occults
+from covid.util import regularize_occults, RunningCovariance
 
 # pylint: disable=missing-class-docstring,missing-function-docstring
 
 
+class TestRunningCovariance(unittest.TestCase):
+    def test_matches_np_cov(self):
+        rng = np.random.RandomState(42)
+        draws = rng.standard_normal((100, 3))
+
+        running = RunningCovariance(3)
+        for block in np.split(draws, 10):
+            running.update(block)
+
+        np.testing.assert_allclose(running.mean, draws.mean(axis=0))
+        np.testing.assert_allclose(running.cov, np.cov(draws, rowvar=False))
+        self.assertEqual(running.n, 100)
+
+
 class TestRegularizeOccults(unittest.TestCase):
     def setUp(self):
         thisdir = os.path.dirname(__file__)